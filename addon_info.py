@@ -1,40 +1,33 @@
+import json
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True, kw_only=True)
 class AddonInfoAuthor:
-    def __init__(self, name: str = None, url: str = None, avatar: str = None,
-                 **kwargs):
-        self.name = name
-        self.url = url
-        self.avatar = avatar
-        [setattr(self, key, value) for (key, value) in kwargs.items()]
+    name: str = None
+    url: str = None
+    avatar: str = None
 
-    @property
-    def __dict__(self):
-        result = {}
-        if self.name:
-            result["name"] = self.name
-        if self.url:
-            result["url"] = self.url
-        if self.avatar:
-            result["avatar"] = self.avatar
-        return result
+    def to_dict(self) -> dict:
+        return {k: v for k, v in (
+            ("name", self.name),
+            ("url", self.url),
+            ("avatar", self.avatar),
+        ) if v}
 
 
+@dataclass(slots=True, kw_only=True)
 class AddonInfoRelease:
-    def __init__(self, targetZoteroVersion: str, tagName: str,
-                 xpiDownloadUrl: dict = None, releaseDate: str = None, id: str = None, xpiVersion: str = None,
-                 name: str = None, description: str = None,
-                 minZoteroVersion: str = None, maxZoteroVersion: str = None,
-                 **kwargs):
-        self.targetZoteroVersion = targetZoteroVersion
-        self.tagName = tagName
-        self.xpiDownloadUrl = xpiDownloadUrl
-        self.releaseDate = releaseDate
-        self.id = id
-        self.xpiVersion = xpiVersion
-        self.name = name
-        self.description = description
-        self.minZoteroVersion = minZoteroVersion
-        self.maxZoteroVersion = maxZoteroVersion
-        [setattr(self, key, value) for (key, value) in kwargs.items()]
+    targetZoteroVersion: str
+    tagName: str
+    xpiDownloadUrl: dict = None
+    releaseDate: str = None
+    id: str = None
+    xpiVersion: str = None
+    name: str = None
+    description: str = None
+    minZoteroVersion: str = None
+    maxZoteroVersion: str = None
 
     @property
     def zotero_check_version(self) -> str:
@@ -44,75 +37,74 @@ class AddonInfoRelease:
             return '7.*'
         raise Exception(f'Invalid targetZoteroVersion({self.targetZoteroVersion})')
 
-    @property
-    def __dict__(self):
-        result = {}
-        if self.targetZoteroVersion:
-            result["targetZoteroVersion"] = self.targetZoteroVersion
-        if self.tagName:
-            result["tagName"] = self.tagName
-        if self.xpiDownloadUrl:
-            result["xpiDownloadUrl"] = self.xpiDownloadUrl
-        if self.releaseDate:
-            result["releaseDate"] = self.releaseDate
-        if self.id:
-            result["id"] = self.id
-        if self.xpiVersion:
-            result["xpiVersion"] = self.xpiVersion
-        if self.name:
-            result["name"] = self.name
-        if self.description:
-            result["description"] = self.description
-        if self.minZoteroVersion:
-            result["minZoteroVersion"] = self.minZoteroVersion
-        if self.maxZoteroVersion:
-            result["maxZoteroVersion"] = self.maxZoteroVersion
-        return result
+    def to_dict(self) -> dict:
+        return {k: v for k, v in (
+            ("targetZoteroVersion", self.targetZoteroVersion),
+            ("tagName", self.tagName),
+            ("xpiDownloadUrl", self.xpiDownloadUrl),
+            ("releaseDate", self.releaseDate),
+            ("id", self.id),
+            ("xpiVersion", self.xpiVersion),
+            ("name", self.name),
+            ("description", self.description),
+            ("minZoteroVersion", self.minZoteroVersion),
+            ("maxZoteroVersion", self.maxZoteroVersion),
+        ) if v}
 
 
+@dataclass(slots=True, kw_only=True)
 class AddonInfo:
-    def __init__(self, repo: str,
-                 releases: list[dict] | list[AddonInfoRelease],
-                 name: str = None,
-                 description: str = None,
-                 stars: int = None,
-                 author: dict | AddonInfoAuthor = None,
-                 **kwargs):
-        self.repo = repo
-        self.releases = [e if isinstance(e, AddonInfoRelease) else AddonInfoRelease(**(e if e else {})) for e in releases]
-        self.name = name
-        self.description = description
-        self.stars = stars
-        self.author = author if isinstance(author, AddonInfoAuthor) else AddonInfoAuthor(**(author if author else {}))
-        [setattr(self, key, value) for (key, value) in kwargs.items()]
+    repo: str
+    releases: list[AddonInfoRelease]
+    name: str = None
+    description: str = None
+    stars: int = None
+    author: AddonInfoAuthor = field(default_factory=AddonInfoAuthor)
+    _owner: str = field(default=None, init=False, repr=False)
+    _repository: str = field(default=None, init=False, repr=False)
+    _slug: str = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        parts = self.repo.split('/')
+        if len(parts) == 2:
+            self._owner, self._repository = parts
+            self._slug = f'{self._owner}#{self._repository}'
+        self.releases = [e if isinstance(e, AddonInfoRelease) else AddonInfoRelease(**(e if e else {}))
+                         for e in self.releases]
+        if not isinstance(self.author, AddonInfoAuthor):
+            self.author = AddonInfoAuthor(**(self.author if self.author else {}))
 
     @property
     def owner(self):
-        if len(self.repo.split('/')) != 2:
-            return None
-        return self.repo.split('/')[0]
+        return self._owner
 
     @property
     def repository(self):
-        if len(self.repo.split('/')) != 2:
-            return None
-        return self.repo.split('/')[1]
+        return self._repository
 
     @property
-    def __dict__(self):
-        result = {}
-        if self.repo:
-            result["repo"] = self.repo
-        if self.releases:
-            result["releases"] = [release.__dict__ for release in self.releases]
-        if self.name:
-            result["name"] = self.name
-        if self.description:
-            result["description"] = self.description
+    def slug(self):
+        """`owner#repository`, used to name files of this addon"""
+        return self._slug
+
+    def to_dict(self) -> dict:
+        result = {k: v for k, v in (
+            ("repo", self.repo),
+            ("releases", [release.to_dict() for release in self.releases]),
+            ("name", self.name),
+            ("description", self.description),
+            ("stars", self.stars),
+        ) if v}
         if self.stars:
-            result["stars"] = self.stars
             # todo: Deprecation, used for z7 < 1.5.3 and z6 < 0.6.7
             result["star"] = self.stars
         if self.author:
-            result["author"] = self.author.__dict__
+            result["author"] = self.author.to_dict()
         return result
+
+
+class AddonEncoder(json.JSONEncoder):
+    def default(self, o):
+        if hasattr(o, 'to_dict'):
+            return o.to_dict()
+        return super().default(o)
@@ -13,28 +13,41 @@ fallback_associated_map = {
 }
 
 
+_container_types = {list, dict}
+_missing = object()
+
+
 def fallback_if_need(current, previous, associate_map=None):
     if associate_map is None:
         associate_map = fallback_associated_map
-    if previous and current and isinstance(previous, type(current)):
-        if isinstance(current, dict):
-            for key, value in previous.items():
-                if key in associate_map.get(fallback_associated_exclude_ids, []):
+    # iterative pre-order walk, children are pushed reversed to keep the recursive visiting order
+    stack = [(current, previous, associate_map)]
+    while stack:
+        cur_node, prev_node, node_map = stack.pop()
+        if not (prev_node and cur_node and type(prev_node) is type(cur_node)):
+            continue
+        children = []
+        if isinstance(cur_node, dict):
+            exclude_ids = node_map.get(fallback_associated_exclude_ids, ())
+            for key, value in prev_node.items():
+                if key in exclude_ids:
                     continue
-                if key in current and (isinstance(value, (list, dict))):
-                    if current[key]:
-                        fallback_if_need(current[key], value, associate_map.get(key, {}))
+                cur_value = cur_node.get(key, _missing)
+                if cur_value is _missing:
+                    print(f'fallback {key}')
+                    cur_node[key] = value
+                elif type(value) in _container_types:
+                    if cur_value:
+                        children.append((cur_value, value, node_map.get(key, {})))
                     else:
                         print(f'fallback {key}')
-                        current[key] = value
-                elif key not in current:
-                    print(f'fallback {key}')
-                    current[key] = value
+                        cur_node[key] = value
 
-        elif isinstance(current, list) and (uid := associate_map.get(fallback_associated_unique_id)):
-            for value in previous:
+        elif isinstance(cur_node, list) and (uid := node_map.get(fallback_associated_unique_id)):
+            for value in prev_node:
                 if not isinstance(value, dict):
                     continue
-                if cur := next((x for x in current if isinstance(x, dict) and x[uid] == value[uid]), None):
-                    fallback_if_need(cur, value, associate_map.get(uid, {}))
+                if cur := next((x for x in cur_node if isinstance(x, dict) and x[uid] == value[uid]), None):
+                    children.append((cur, value, node_map.get(uid, {})))
+        stack.extend(reversed(children))
     return current
@@ -1,25 +1,41 @@
 import os
 import shutil
+import threading
 import hashlib
 
 
 def folder_filename_hash(dir):
-    filenames = sorted(os.listdir(dir))
-    folder_hash = hashlib.new('sha256')
-    for filename in filenames:
-        hash_obj = hashlib.new('sha256')
-        hash_obj.update(filename.encode('utf-8'))
-        folder_hash.update(hash_obj.hexdigest().encode('utf-8'))
-    return folder_hash.hexdigest()
+    filenames = sorted(entry.name for entry in os.scandir(dir))
+    return hashlib.sha256(b''.join(filename.encode('utf-8') + b'\x00' for filename in filenames)).hexdigest()
 
 
 def update_cache(cache_directory, runtime_xpi_directory, cache_hash_filename):
     if not cache_directory or not runtime_xpi_directory or cache_directory == runtime_xpi_directory:
         return
     try:
-        shutil.rmtree(cache_directory)
-        shutil.move(runtime_xpi_directory, cache_directory)
-        folder_hash = folder_filename_hash(cache_directory)
+        # same xpi set as the cache, keep the cache and its lockfile untouched
+        folder_hash = folder_filename_hash(runtime_xpi_directory)
+        try:
+            with open(os.path.join(cache_directory, cache_hash_filename)) as file:
+                if file.read() == folder_hash:
+                    shutil.rmtree(runtime_xpi_directory, ignore_errors=True)
+                    print(f'{folder_hash} unchanged')
+                    return
+        except FileNotFoundError:
+            pass
+
+        # swap the directories by rename so the cache is never left empty, drop the old one afterwards
+        old_cache_directory = cache_directory.rstrip('/\\') + '.old'
+        shutil.rmtree(old_cache_directory, ignore_errors=True)
+        if os.path.exists(cache_directory):
+            os.replace(cache_directory, old_cache_directory)
+        try:
+            os.replace(runtime_xpi_directory, cache_directory)
+        except OSError:
+            # different filesystems can not be renamed across
+            shutil.move(runtime_xpi_directory, cache_directory)
+        # unlinking the old xpis overlaps with the remaining steps, the process still waits for it before exiting
+        threading.Thread(target=shutil.rmtree, args=(old_cache_directory,), kwargs={'ignore_errors': True}).start()
         with open(os.path.join(cache_directory, cache_hash_filename), 'w') as file:
             file.write(folder_hash)
         print(folder_hash)
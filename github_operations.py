@@ -1,17 +1,221 @@
-import json
+import concurrent.futures
+import functools
 import time
+import threading
+import urllib.parse
 import requests
+import json_utils
+from types import MappingProxyType
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta, UTC
 
 
+class GitHubApiAdapter(HTTPAdapter):
+    """caps concurrent api.github.com requests and pauses when the rate limit is almost used up"""
+
+    def __init__(self, max_concurrency=10, min_remaining=50, **kwargs):
+        super().__init__(pool_maxsize=max_concurrency, pool_block=True, **kwargs)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._min_remaining = min_remaining
+        # rate limit resource ('core', 'graphql', 'search', ...) -> time its budget resets
+        self._resume_at = {}
+
+    @staticmethod
+    def _resource(url):
+        path = urllib.parse.urlsplit(url).path
+        if path.startswith('/graphql'):
+            return 'graphql'
+        if path.startswith('/search/'):
+            return 'search'
+        return 'core'
+
+    def send(self, request, **kwargs):
+        resource = self._resource(request.url)
+        with self._semaphore:
+            if (delay := self._resume_at.get(resource, 0) - time.time()) > 0:
+                time.sleep(delay)
+            response = super().send(request, **kwargs)
+            if not kwargs.get('stream'):
+                # the body is still on the wire when send returns, read it before letting the next request in
+                response.content
+        self._throttle(resource, response.headers)
+        return response
+
+    def _throttle(self, resource, headers):
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            limit = int(headers['X-RateLimit-Limit'])
+            reset = int(headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        resource = headers.get('X-RateLimit-Resource') or resource
+        # unauthenticated limits are tiny, only pause those once fully used
+        if remaining < min(self._min_remaining, limit // 100) + 1 and reset > self._resume_at.get(resource, 0):
+            print(f'{resource} rate limit remaining {remaining}/{limit}, pause until {reset}')
+            self._resume_at[resource] = reset
+
+
+class GitHubRetry(Retry):
+    """also waits out 403 responses carrying Retry-After, which github sends for its secondary rate limit"""
+    RETRY_AFTER_STATUS_CODES = Retry.RETRY_AFTER_STATUS_CODES | {403}
+
+
+def resize_session_pool(pool_maxsize=64):
+    retries = GitHubRetry(total=5,
+                          backoff_factor=1.0,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(['GET', 'DELETE']),
+                          respect_retry_after_header=True,
+                          raise_on_status=False)
+    # xpis and update manifests come from many hosts, keep a pool per host instead of evicting them
+    SESSION.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize, max_retries=retries))
+    SESSION.mount('https://api.github.com', GitHubApiAdapter(max_retries=retries))
+
+
+SESSION = requests.Session()
+resize_session_pool()
+
+
+@functools.cache
 def github_api_headers(**kwargs):
+    """shared between calls, read-only, copy it to add headers"""
     result = {
         'Accept': 'application/vnd.github+json',
         'X-GitHub-Api-Version': '2022-11-28',
     }
     if github_token := kwargs.get('github_token'):
         result['Authorization'] = f'token {github_token}'
-    return result
+    return MappingProxyType(result)
+
+
+# url -> {'etag': ..., 'body': ..., 'derived': {...}}, persisted between runs for conditional requests
+# `derived` holds results computed from the body, it is dropped whenever the body changes
+_etag_cache = {}
+_etag_cache_lock = threading.Lock()
+# urls requested in this run, only their entries are written back so removed addons age out
+_etag_cache_used = set()
+
+
+def load_etag_cache(filepath):
+    try:
+        with open(filepath, 'rb') as file:
+            _etag_cache.update(json_utils.loads(file.read()))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f'load etag cache failed: {e}')
+
+
+def save_etag_cache(filepath):
+    try:
+        with _etag_cache_lock:
+            # sorted so an unchanged cache writes identical bytes and is not saved again
+            json_utils.dump({url: _etag_cache[url] for url in sorted(_etag_cache_used) if url in _etag_cache}, filepath)
+    except Exception as e:
+        print(f'save etag cache failed: {e}')
+
+
+def keep_etag_entries(urls, url_prefix=None):
+    """keeps entries of lookups skipped in this run, e.g. addons resumed from an interrupted run"""
+    with _etag_cache_lock:
+        _etag_cache_used.update(url for url in _etag_cache
+                                if url in urls or (url_prefix and url.startswith(url_prefix)))
+
+
+def conditional_get(url, headers):
+    """returns the decoded body and whether it is unchanged since the cached response"""
+    with _etag_cache_lock:
+        cached = _etag_cache.get(url)
+        _etag_cache_used.add(url)
+    if cached:
+        headers = {**headers, 'If-None-Match': cached['etag']}
+    resp = SESSION.get(url, headers=headers)
+    if resp.status_code == 304 and cached:
+        return cached['body'], True
+    # error payloads like 404/403 messages are not results, let callers report them
+    resp.raise_for_status()
+    body = json_utils.loads(resp.content)
+    if resp.status_code == 200 and (etag := resp.headers.get('ETag')):
+        with _etag_cache_lock:
+            _etag_cache[url] = {'etag': etag, 'body': body}
+    return body, False
+
+
+def get_with_etag(url, headers):
+    return conditional_get(url, headers)[0]
+
+
+def get_etag_derived(url, key):
+    with _etag_cache_lock:
+        return _etag_cache.get(url, {}).get('derived', {}).get(key)
+
+
+def set_etag_derived(url, key, value):
+    with _etag_cache_lock:
+        if cached := _etag_cache.get(url):
+            cached.setdefault('derived', {})[key] = value
+
+
+_plugin_graphql_query = '''
+query ($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    description
+    stargazerCount
+    owner {
+      login
+      url
+      avatarUrl
+      ... on User { name }
+      ... on Organization { name }
+    }
+    releases(first: 100, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes {
+        tagName
+        isPrerelease
+        isDraft
+        releaseAssets(first: 50) {
+          nodes { databaseId contentType updatedAt downloadUrl }
+        }
+      }
+    }
+  }
+}
+'''
+
+
+def graphql_plugin_info(owner, repository, headers):
+    """author, repo and release list of a repository in one graphql request, shaped like the rest responses"""
+    resp = SESSION.post('https://api.github.com/graphql',
+                        json={'query': _plugin_graphql_query, 'variables': {'owner': owner, 'name': repository}},
+                        headers=headers)
+    payload = json_utils.loads(resp.content)
+    if errors := payload.get('errors'):
+        raise Exception(errors)
+    repository_info = payload['data']['repository']
+    owner_info = repository_info.get('owner') or {}
+    author_info = {
+        'login': owner_info.get('login'),
+        'name': owner_info.get('name'),
+        'html_url': owner_info.get('url'),
+        'avatar_url': owner_info.get('avatarUrl'),
+    }
+    repo_info = {
+        'description': repository_info.get('description'),
+        'stargazers_count': repository_info.get('stargazerCount'),
+    }
+    releases_info = [{
+        'tag_name': release.get('tagName'),
+        'prerelease': release.get('isPrerelease'),
+        'draft': release.get('isDraft'),
+        'assets': [{
+            'id': asset.get('databaseId'),
+            'content_type': asset.get('contentType'),
+            'updated_at': asset.get('updatedAt'),
+            'browser_download_url': asset.get('downloadUrl'),
+        } for asset in (release.get('releaseAssets') or {}).get('nodes') or []],
+    } for release in (repository_info.get('releases') or {}).get('nodes') or []]
+    return author_info, repo_info, releases_info
 
 
 def report_issue(github_repository: str, title: str, body: str, **kwargs):
@@ -22,21 +226,22 @@ def report_issue(github_repository: str, title: str, body: str, **kwargs):
         if issue_check_id := kwargs.get('id'):
             body = f'{body}\n----{issue_check_id}'
             try:
-                response = requests.get(f'https://api.github.com/repos/{github_repository}/issues',
+                response = SESSION.get(f'https://api.github.com/repos/{github_repository}/issues',
                                         headers=github_api_headers(github_token=kwargs.get('github_token')),
                                         params={
                                             'state': 'open',
                                             'since': (datetime.now(UTC) - timedelta(days=10)).strftime('%Y-%m-%dT%H:%M:%S') + 'Z',
                                             'per_page': 100,
                                         })
-                exist_issues = response.json()
+                response.raise_for_status()
+                exist_issues = json_utils.loads(response.content)
                 for issue in exist_issues:
                     if issue.get('body').endswith(f'----{issue_check_id}'):
                         return
             except Exception as e:
                 print(f'fetch from exist issues failed: {e}')
 
-        response = requests.post(f'https://api.github.com/repos/{github_repository}/issues',
+        response = SESSION.post(f'https://api.github.com/repos/{github_repository}/issues',
                                  headers=github_api_headers(github_token=kwargs.get('github_token')),
                                  json={
                                      'title': title,
@@ -45,7 +250,7 @@ def report_issue(github_repository: str, title: str, body: str, **kwargs):
 
         if response.status_code == 201:
             print('Issue created successfully.')
-            print('Issue URL:', response.json()['html_url'])
+            print('Issue URL:', json_utils.loads(response.content)['html_url'])
         else:
             print('Failed to create issue.')
             print('Response:', response.content)
@@ -54,13 +259,13 @@ def report_issue(github_repository: str, title: str, body: str, **kwargs):
 
 
 def upload_json_to_release(github_repository, release_id, upload_file_name, upload_file, **kwargs):
-    headers = github_api_headers(github_token=kwargs.get('github_token'))
-    headers["Content-Type"] = "application/octet-stream"
     upload_url = (f'https://uploads.github.com/repos/{github_repository}'
                   f'/releases/{release_id}/assets?name={upload_file_name}')
     try:
+        headers = {**github_api_headers(github_token=kwargs.get('github_token')),
+                   "Content-Type": "application/octet-stream"}
         with open(upload_file, "rb") as file:
-            upload_resp = requests.post(upload_url, data=file, headers=headers)
+            upload_resp = SESSION.post(upload_url, data=file, headers=headers)
             if upload_resp.status_code != 201:
                 print(f'upload release assets code: {upload_resp.status_code}')
             else:
@@ -83,10 +288,10 @@ def create_release(github_repository, **kwargs):
         'generate_release_notes': False,
     }
     try:
-        create_resp = requests.post(create_release_url, json=param,
+        create_resp = SESSION.post(create_release_url, json=param,
                                     headers=github_api_headers(github_token=kwargs.get('github_token')))
         if create_resp.status_code == 201:
-            create_release_info = json.loads(create_resp.content)
+            create_release_info = json_utils.loads(create_resp.content)
             release_id = create_release_info['id']
             return release_id
         else:
@@ -100,22 +305,35 @@ def delete_cache(github_repository, github_token, remain_count=2):
     get_caches_url = (f'https://api.github.com/repos/{github_repository}'
                       f'/actions/caches?per_page=100&sort=last_accessed_at&direction=desc')
     try:
-        caches_resp = requests.get(get_caches_url, headers=headers)
-        caches = json.loads(caches_resp.content)
+        caches = get_with_etag(get_caches_url, headers)
         if caches.get('total_count', 0) < remain_count:
             return
         delete_cache_url = f'https://api.github.com/repos/{github_repository}/actions/caches/'
-        for cache in caches.get('actions_caches', [])[remain_count:]:
+
+        def delete(cache):
             cache_key = cache.get('key')
             if cache_id := cache.get('id'):
                 try:
-                    delete_cache_resp = requests.delete(f'{delete_cache_url}{cache_id}', headers=headers)
+                    delete_cache_resp = SESSION.delete(f'{delete_cache_url}{cache_id}', headers=headers)
                     if delete_cache_resp.status_code == 204:
                         print(f'delete {cache_key} succeed')
                     else:
                         print(f'delete {cache_key} failed: {delete_cache_resp.text}')
                 except Exception as e:
                     print(f'delete cache for {cache_key} failed: {e}')
+
+        # xpi and etag caches are saved under their own key prefixes, keep the newest ones of each
+        remained = {}
+        outdated_caches = []
+        for cache in caches.get('actions_caches', []):
+            key_prefix = (cache.get('key') or '').rpartition('-')[0]
+            remained[key_prefix] = remained.get(key_prefix, 0) + 1
+            if remained[key_prefix] > remain_count:
+                outdated_caches.append(cache)
+
+        # deletions are independent, the api adapter still caps how many run at once
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(delete, outdated_caches))
     except Exception as e:
         print(f'get caches failed: {e}')
 
@@ -125,8 +343,7 @@ def delete_release(github_repository, github_token, remain_count=2):
     get_release_url = (f'https://api.github.com/repos/{github_repository}'
                        f'/releases?per_page=100&page=1')
     try:
-        releases_resp = requests.get(get_release_url, headers=headers)
-        releases = json.loads(releases_resp.content)
+        releases = get_with_etag(get_release_url, headers)
         if len(releases) < remain_count:
             return
         releases.sort(key=lambda release: release['tag_name'], reverse=True)
@@ -135,7 +352,7 @@ def delete_release(github_repository, github_token, remain_count=2):
             release_tag = release.get('tag_name')
             if release_id := release.get('id'):
                 try:
-                    delete_release_resp = requests.delete(f'{delete_release_url}{release_id}', headers=headers)
+                    delete_release_resp = SESSION.delete(f'{delete_release_url}{release_id}', headers=headers)
                     if delete_release_resp.status_code == 204:
                         print(f'delete release {release_tag} succeed')
                     else:
@@ -151,8 +368,7 @@ def delete_tag(github_repository, github_token, remain_count=2):
     get_tags_url = (f'https://api.github.com/repos/{github_repository}'
                     f'/git/refs/tags')
     try:
-        tags_response = requests.get(get_tags_url, headers=headers)
-        tags = json.loads(tags_response.content)
+        tags = get_with_etag(get_tags_url, headers)
         if len(tags) < remain_count:
             return
         tags.sort(key=lambda tag: tag['ref'], reverse=True)
@@ -166,7 +382,7 @@ def delete_tag(github_repository, github_token, remain_count=2):
                 except ValueError:
                     continue
                 try:
-                    delete_tag_resp = requests.delete(f'{delete_tag_url}{ref}', headers=headers)
+                    delete_tag_resp = SESSION.delete(f'{delete_tag_url}{ref}', headers=headers)
                     if delete_tag_resp.status_code == 204:
                         print(f'delete tag {ref} succeed')
                     else:
@@ -179,8 +395,9 @@ def delete_tag(github_repository, github_token, remain_count=2):
 
 def rate_limit(github_token):
     try:
-        resp = requests.get('https://api.github.com/rate_limit', headers=github_api_headers(github_token=github_token))
-        rate = json.loads(resp.content)
+        resp = SESSION.get('https://api.github.com/rate_limit', headers=github_api_headers(github_token=github_token))
+        resp.raise_for_status()
+        rate = json_utils.loads(resp.content)
         print(f'token rate {rate.get("rate")}')
     except Exception as e:
         print(f'get rate limit failed: {e}')
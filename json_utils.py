@@ -0,0 +1,27 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content: bytes | str):
+    if orjson:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(obj, default=None) -> bytes:
+    if orjson:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(obj, ensure_ascii=False, default=default).encode()
+
+
+def dump(obj, filepath: str, default=None):
+    if orjson:
+        with open(filepath, 'wb') as file:
+            file.write(orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATACLASS))
+    else:
+        with open(filepath, 'w') as file:
+            json.dump(obj, file, ensure_ascii=False, default=default)
@@ -1,115 +1,326 @@
 import concurrent.futures
+import operator
+import stat
 import urllib.parse
 import argparse
+import threading
+import time
 from addon_info import *
 from fallback_infos import fallback_if_need
-from moz_addons import addon_details, compare_versions
+from moz_addons import addon_manifest_details, compare_versions, validate_xpi, xpi_detail_from_manifests
 from github_operations import *
 from file_cache import *
+import json_utils
+
+
+# xpis are a few MB at most, anything far larger is not an addon worth keeping
+MAX_XPI_BYTES = 50 * 1024 * 1024
+
+# download folders already created in this run, all xpis share a few of them
+_ensured_dirs = set()
+
+
+def file_size(filepath: str) -> int:
+    """size of a regular file with a single stat call, 0 when it is missing"""
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return 0
+    return st.st_size if stat.S_ISREG(st.st_mode) else 0
+
+
+def ensure_folder(filepath: str):
+    folder = os.path.dirname(filepath)
+    if folder and folder not in _ensured_dirs:
+        os.makedirs(folder, exist_ok=True)
+        _ensured_dirs.add(folder)
+
+
+def link_cached_xpi(unique_name: str, download_dir: str, cache_dir: str):
+    """puts a cached xpi into the download dir, returns its path there or None when it is not cached"""
+    cache_filepath = os.path.join(cache_dir, unique_name)
+    if not file_size(cache_filepath):
+        return
+    download_filepath = os.path.join(download_dir, unique_name)
+    ensure_folder(download_filepath)
+    try:  # cached xpis are never modified in place, share the inode instead of copying
+        os.link(cache_filepath, download_filepath)
+    except FileExistsError:
+        if not os.path.samefile(cache_filepath, download_filepath):
+            shutil.copyfile(cache_filepath, download_filepath)
+    except OSError:
+        shutil.copyfile(cache_filepath, download_filepath)
+    return download_filepath
 
 
 def download_xpi(xpi_url: str, download_dir: str, unique_name: str, force_download: bool, **kwargs):
     try:
         download_filepath = os.path.join(download_dir, unique_name)
-        folder = os.path.dirname(download_filepath)
-        if folder and not os.path.exists(folder):
-            os.makedirs(folder)
-
-        if cache_dir := kwargs.get('cache_dir'):
-            cache_filepath = os.path.join(cache_dir, unique_name)
-            if not force_download and os.path.isfile(cache_filepath):
-                shutil.copy(cache_filepath, download_filepath)  # copy to download filepath
-                return download_filepath
+        ensure_folder(download_filepath)
 
+        if (cache_dir := kwargs.get('cache_dir')) and not force_download:
+            if cached_filepath := link_cached_xpi(unique_name, download_dir, cache_dir):
+                return cached_filepath
+
+        # the asset id is part of the name, an existing file is the unchanged asset
+        # forced downloads come after the local xpi was found broken, always replace it then
         if not force_download and os.path.isfile(download_filepath):
             return download_filepath
 
-        response = requests.get(xpi_url, stream=True)
-        if response.status_code == 200:
-            print(f'download {unique_name} from {xpi_url}')
-            with open(download_filepath, "wb") as file:
-                for chunk in response.iter_content(chunk_size=1024):
-                    file.write(chunk)
-            return download_filepath
+        with SESSION.get(xpi_url, stream=True) as response:
+            if response.status_code == 200:
+                if int(response.headers.get('Content-Length') or 0) > MAX_XPI_BYTES:
+                    print(f'skip download {unique_name} from {xpi_url}: '
+                          f'{response.headers.get("Content-Length")} bytes exceeds {MAX_XPI_BYTES}')
+                    return
+                print(f'download {unique_name} from {xpi_url}')
+                response.raw.decode_content = True
+                # write aside and rename, never truncate a hard-linked cache file or leave a partial xpi
+                partial_filepath = download_filepath + '.part'
+                try:
+                    with open(partial_filepath, "wb") as file:
+                        # chunked responses carry no length, stop as soon as the body passes the cap
+                        written = 0
+                        while chunk := response.raw.read(256 * 1024):
+                            written += len(chunk)
+                            if written > MAX_XPI_BYTES:
+                                raise IOError(f'body exceeds {MAX_XPI_BYTES} bytes')
+                            file.write(chunk)
+                    os.replace(partial_filepath, download_filepath)
+                except BaseException:
+                    # an interrupted download must not be hashed and moved into the cache
+                    if os.path.exists(partial_filepath):
+                        os.remove(partial_filepath)
+                    raise
+                return download_filepath
     except Exception as e:
         print(f'download {unique_name} from {xpi_url} failed: {e}')
 
 
+# responses shared by several plugins, e.g. owners with multiple addons
+# concurrent lookups of the same url wait for the request already in flight
+_shared_responses: dict[str, concurrent.futures.Future] = {}
+_shared_responses_lock = threading.Lock()
+
+
+def get_json_shared(url: str, headers: dict):
+    """returns the decoded body and whether it is unchanged since the previous run"""
+    with _shared_responses_lock:
+        future = _shared_responses.get(url)
+        is_requester = future is None
+        if is_requester:
+            future = _shared_responses[url] = concurrent.futures.Future()
+    if is_requester:
+        try:
+            future.set_result(conditional_get(url, headers))
+        except Exception as e:
+            with _shared_responses_lock:
+                del _shared_responses[url]  # let later plugins retry
+            future.set_exception(e)
+    return future.result()
+
+
+def update_author(plugin: AddonInfo, author_resp_info: dict):
+    plugin.author.name = author_resp_info.get('name') or plugin.owner
+    if html_url := author_resp_info.get('html_url'):
+        plugin.author.url = html_url
+    if avatar_url := author_resp_info.get('avatar_url'):
+        plugin.author.avatar = avatar_url
+
+
+def update_repo(plugin: AddonInfo, repos_info: dict):
+    if (description := repos_info.get('description')) and not plugin.description:
+        plugin.description = description
+    if (stars := repos_info.get('stargazers_count')) is not None:
+        plugin.stars = stars
+
+
+def parse_author(plugin: AddonInfo, headers: dict):
+    author_url = f"https://api.github.com/users/{plugin.owner}"
+    try:
+        author_resp_info, _ = get_json_shared(author_url, headers)
+        update_author(plugin, author_resp_info)
+    except Exception as e:
+        print(f'request {author_url} failed: {e}')
+
+
+def parse_repo(plugin: AddonInfo, headers: dict):
+    repo_url = f'https://api.github.com/repos/{plugin.repo}'
+    try:
+        update_repo(plugin, get_with_etag(repo_url, headers))
+    except Exception as e:
+        print(f'request {repo_url} failed: {e}')
+
+
+def parse_with_graphql(plugin: AddonInfo, headers: dict, **kwargs):
+    """one graphql request replaces the author, repo and release list requests, returns False when it failed"""
+    try:
+        author_info, repo_info, releases_info = graphql_plugin_info(plugin.owner, plugin.repository, headers)
+    except Exception as e:
+        print(f'graphql query of {plugin.repo} failed, fall back to rest api: {e}')
+        return False
+    update_author(plugin, author_info)
+    update_repo(plugin, repo_info)
+    parse_releases(plugin, headers, listed_releases=(releases_info, False), **kwargs)
+    return True
+
+
 # 输出格式参考 [zotero-chinese/zotero-plugins](https://github.com/zotero-chinese/zotero-plugins)
 def parse(plugin: AddonInfo, **kwargs):
     if not plugin.owner or not plugin.releases or len(plugin.releases) <= 0:
         return
+    if not any(release.tagName for release in plugin.releases):
+        return
     plugin.name = plugin.repository
     headers = github_api_headers(github_token=kwargs.get('github_token'))
 
-    # fetch author info
-    author_url = f"https://api.github.com/users/{plugin.owner}"
+    # graphql needs a token
+    if not (kwargs.get('use_graphql') and kwargs.get('github_token') and parse_with_graphql(plugin, headers, **kwargs)):
+        # author, repo and release info are independent, fetch them concurrently
+        info_executor = kwargs.get('info_executor')
+        info_futures = [info_executor.submit(parse_author, plugin, headers),
+                        info_executor.submit(parse_repo, plugin, headers)]
+        parse_releases(plugin, headers, **kwargs)
+        concurrent.futures.wait(info_futures)
+    if plugin.stars is None:
+        plugin.stars = 0
+    return plugin
+
+
+def newest_asset(assets, content_type):
+    return max((asset for asset in assets if asset.get('content_type') == content_type),
+               key=lambda asset: asset.get('updated_at', ''), default=None)
+
+
+def release_xpi_filename(plugin: AddonInfo, release: AddonInfoRelease, release_asset) -> str:
+    return f'{plugin.slug}+{release.tagName}@{release_asset["id"]}.xpi'
+
+
+def keep_cached_xpi(plugin: AddonInfo, release: AddonInfoRelease, release_asset, **kwargs) -> bool:
+    """links the xpi of a reused release into the runtime directory so update_cache keeps it, False when it is not cached"""
+    if not (cache_directory := kwargs.get('cache_directory')) or not (
+            runtime_xpi_directory := kwargs.get('runtime_xpi_directory')):
+        return True
+    unique_name = release_xpi_filename(plugin, release, release_asset)
     try:
-        author_resp = requests.get(author_url, headers=headers)
-        author_resp_info = json.loads(author_resp.content)
-
-        plugin.author.name = author_resp_info['name'] if 'name' in author_resp_info and author_resp_info[
-            'name'] else plugin.owner
-        if 'html_url' in author_resp_info:
-            plugin.author.url = author_resp_info['html_url']
-        if 'avatar_url' in author_resp_info:
-            plugin.author.avatar = author_resp_info['avatar_url']
+        return link_cached_xpi(unique_name, runtime_xpi_directory, cache_directory) is not None
     except Exception as e:
-        print(f'request {author_url} failed: {e}')
+        print(f'keep cached xpi {unique_name} of {plugin.repo} failed: {e}')
+        return False
 
-    # fetch repo info
-    repo_url = f'https://api.github.com/repos/{plugin.repo}'
+
+def reusable_previous_release(plugin: AddonInfo, release: AddonInfoRelease, release_asset, **kwargs) -> bool:
+    """a published release is reused only when its xpi is cached and declares no update_url"""
+    # update manifests can publish newer xpis without touching the release, published infos do not record them
+    if not (cache_directory := kwargs.get('cache_directory')) or not (
+            runtime_xpi_directory := kwargs.get('runtime_xpi_directory')):
+        return False
+    unique_name = release_xpi_filename(plugin, release, release_asset)
     try:
-        repos_resp = requests.get(repo_url, headers=headers)
-        repos_info = json.loads(repos_resp.content)
-        if 'description' in repos_info and repos_info['description'] and not plugin.description:
-            plugin.description = repos_info['description']
-        if 'stargazers_count' in repos_info and repos_info['stargazers_count'] is not None:
-            plugin.stars = repos_info['stargazers_count']
+        if not (xpi_filepath := link_cached_xpi(unique_name, runtime_xpi_directory, cache_directory)):
+            return False
+        return not any(details.get('update_url') for details in xpi_manifest_details(xpi_filepath).values())
     except Exception as e:
-        print(f'request {repo_url} failed: {e}')
+        print(f'check cached xpi {unique_name} of {plugin.repo} failed: {e}')
+        return False
 
-    # fetch release info
+
+def parse_releases(plugin: AddonInfo, headers: dict, listed_releases=None, **kwargs):
     invalid_releases = []
+    release_assets = []
+    # one list request serves latest, pre and pinned tags, tags missing from it are looked up one by one
+    releases_url = f'https://api.github.com/repos/{plugin.repo}/releases'
+    releases_list_url = releases_url + '?per_page=100'
+    if listed_releases is None:
+        try:
+            listed_releases = conditional_get(releases_list_url, headers)
+        except Exception as e:
+            print(f'handle {plugin.repo} request {releases_list_url} failed: {e}')
+            listed_releases = [], False
+    releases_info, releases_not_modified = listed_releases
+    if not isinstance(releases_info, list):
+        releases_info = []
+    releases_by_tag = {info.get('tag_name'): info for info in releases_info}
+    latest_release_info = next((info for info in releases_info
+                                if not info.get('prerelease') and not info.get('draft')), None)
+    pre_release_info = next((info for info in releases_info if info.get('prerelease')), None)
+
+    # releases missing from the list are looked up concurrently
+    info_executor = kwargs.get('info_executor')
+    release_lookups = {}
+    for release in plugin.releases:
+        if release.tagName == 'latest':
+            if not releases_info:
+                lookup_url = releases_url + '/latest'
+            else:
+                continue
+        elif release.tagName and release.tagName != 'pre' and release.tagName not in releases_by_tag:
+            lookup_url = releases_url + '/tags/' + release.tagName
+        else:
+            continue
+        if lookup_url not in release_lookups:
+            release_lookups[lookup_url] = info_executor.submit(conditional_get, lookup_url, headers)
+
     for release in plugin.releases:
         if not release.tagName:
             continue
-        release_url = f'https://api.github.com/repos/{plugin.repo}/releases'
-        if release.tagName == 'latest':
-            release_url += '/latest'
-        elif release.tagName != 'pre':
-            release_url += f'/tags/{release.tagName}'
+        release_key = f'{release.tagName}@{release.targetZoteroVersion}'
+        release_url = releases_list_url
 
         try:
-            release_resp = requests.get(release_url, headers=headers)
-            release_info = json.loads(release_resp.content)
-
-            if release.tagName == 'pre':
-                release_info = [info for info in release_info if info['prerelease']]
-                if release_info:
-                    release_info = release_info[0]
-                else:
-                    continue
-            if 'tag_name' in release_info:
-                release.tagName = release_info['tag_name']
+            if release.tagName == 'latest':
+                release_info, not_modified = latest_release_info, releases_not_modified
+                if not releases_info:
+                    release_url = releases_url + '/latest'
+                    release_info, not_modified = release_lookups[release_url].result()
+            elif release.tagName == 'pre':
+                release_info, not_modified = pre_release_info, releases_not_modified
+            else:
+                release_info, not_modified = releases_by_tag.get(release.tagName), releases_not_modified
+                if not release_info:
+                    release_url = releases_url + '/tags/' + release.tagName
+                    release_info, not_modified = release_lookups[release_url].result()
+            if not release_info:
+                continue
+
+            if tag_name := release_info.get('tag_name'):
+                release.tagName = tag_name
 
-            if 'assets' not in release_info:
+            all_release_assets = release_info.get('assets') or []
+            release_asset = newest_asset(all_release_assets, 'application/x-xpinstall')
+            if release_asset is None:
+                release_asset = newest_asset(all_release_assets, 'application/x-zip-compressed')
+            if release_asset is None or not release_asset.get('browser_download_url'):
                 continue
-            all_release_assets = release_info['assets']
-            all_release_assets.sort(key=lambda item: item['updated_at'] if 'updated_at' in item else '', reverse=True)
-            release_assets = [asset for asset in all_release_assets if asset['content_type'] == 'application/x-xpinstall']
-            if not release_assets:
-                release_assets = [asset for asset in all_release_assets if asset['content_type'] == 'application/x-zip-compressed']
-            if not release_assets:
+            # release unchanged since it was last parsed cleanly, skip the xpi refresh
+            if (not_modified and (previous := get_etag_derived(release_url, release_key))
+                    and keep_cached_xpi(plugin, release, release_asset, **kwargs)):
+                for key, value in previous.items():
+                    setattr(release, key, value)
                 continue
-            release_asset = release_assets[0]
-            if 'browser_download_url' not in release_asset:
+            # the same asset was parsed by a previous run, reuse it without downloading
+            asset_key = (plugin.repo, release.targetZoteroVersion,
+                         release_asset['browser_download_url'], release_asset.get('updated_at'))
+            if ((previous := kwargs.get('previous_releases', {}).get(asset_key))
+                    and reusable_previous_release(plugin, release, release_asset, **kwargs)):
+                for key, value in previous.items():
+                    if hasattr(release, key):
+                        setattr(release, key, value)
                 continue
-            details = parse_xpi_detail(
-                plugin=plugin, release=release, release_asset=release_asset,
-                **kwargs,
-            )
+            release_assets.append((release, release_url, release_key, release_asset))
+        except Exception as e:
+            print(f'handle {plugin.repo} request {release_url} failed: {e}')
 
+    # xpi downloads are not limited by the api rate limit, they run on their own larger pool
+    download_executor = kwargs.get('download_executor')
+    detail_futures = [download_executor.submit(parse_xpi_detail,
+                                               plugin=plugin, release=release, release_asset=release_asset,
+                                               **kwargs)
+                      for release, _, _, release_asset in release_assets]
+
+    for (release, release_url, release_key, _), detail_future in zip(release_assets, detail_futures):
+        try:
+            details = detail_future.result()
             if details:
                 if detail_id := details.id:
                     release.id = detail_id
@@ -124,7 +335,7 @@ def parse(plugin: AddonInfo, **kwargs):
                 if zotero_max_version := details.max_version:
                     release.maxZoteroVersion = zotero_max_version
 
-                if not details.check_compatible_for_zotero_version(release.zotero_check_version):
+                if not (compatible := details.check_compatible_for_zotero_version(release.zotero_check_version)):
                     invalid_releases.append(release)
 
                 if ((not release.minZoteroVersion or release.minZoteroVersion == '*') and
@@ -134,29 +345,69 @@ def parse(plugin: AddonInfo, **kwargs):
                                  body=f'xpi: https://github.com/{plugin.repo} @{release.tagName} on {release.targetZoteroVersion}\n',
                                  github_token=kwargs.get('github_token'),
                                  id=f'Parse min/max version failed: {plugin.repo}+{release.tagName}@{release.targetZoteroVersion}')
+                elif compatible and not details.update_url:
+                    # update manifests can publish newer xpis without touching the release, never reuse those
+                    set_etag_derived(release_url, release_key, release.to_dict())
             else:
                 report_issue(kwargs.get('github_repository'),
                              title=f'Parse {plugin.repo} addon details failed',
                              body=f'xpi: https://github.com/{plugin.repo} @{release.tagName} on {release.targetZoteroVersion}\n',
                              github_token=kwargs.get('github_token'),
                              id=f'Parse details failed: {plugin.repo}+{release.tagName}@{release.targetZoteroVersion}')
+        except Exception as e:
+            print(f'handle {plugin.repo} xpi of {release.tagName} failed: {e}')
 
+    for invalid_release in invalid_releases:
+        print(plugin.repo, 'invalid', invalid_release.zotero_check_version)
+        report_issue(kwargs.get('github_repository'),
+                     title=f'Invalid {plugin.repo} xpi with zotero version {invalid_release.zotero_check_version}',
+                     body=f'xpi: https://github.com/{plugin.repo} @{invalid_release.tagName}\n'
+                          f'min zotero Version:{invalid_release.minZoteroVersion}\n'
+                          f'max Zotero version:{invalid_release.maxZoteroVersion}'
+                          f'expect Zotero version:{invalid_release.zotero_check_version}\n',
+                     github_token=kwargs.get('github_token'),
+                     id=f'Target zotero version not match: {plugin.repo}+{invalid_release.tagName}@{invalid_release.targetZoteroVersion}')
+    if invalid_releases:
+        # releases compare by value, drop exactly the invalid objects
+        invalid_ids = {id(invalid_release) for invalid_release in invalid_releases}
+        plugin.releases = [release for release in plugin.releases if id(release) not in invalid_ids]
 
-        except Exception as e:
-            print(f'handle {plugin.repo} request {release_url} failed: {e}')
 
-        for invalid_release in invalid_releases:
-            print(plugin.repo, 'invalid', invalid_release.zotero_check_version)
-            report_issue(kwargs.get('github_repository'),
-                         title=f'Invalid {plugin.repo} xpi with zotero version {invalid_release.zotero_check_version}',
-                         body=f'xpi: https://github.com/{plugin.repo} @{invalid_release.tagName}\n'
-                              f'min zotero Version:{invalid_release.minZoteroVersion}\n'
-                              f'max Zotero version:{invalid_release.maxZoteroVersion}'
-                              f'expect Zotero version:{invalid_release.zotero_check_version}\n',
-                         github_token=kwargs.get('github_token'),
-                         id=f'Target zotero version not match: {plugin.repo}+{invalid_release.tagName}@{release.targetZoteroVersion}')
-            plugin.releases.remove(invalid_release)
-    return plugin
+# same escaping as urllib.parse.quote for ascii urls, in one str.translate call
+_quote_table = str.maketrans({chr(c): urllib.parse.quote(chr(c)) for c in range(128)})
+
+
+def quote_url(url: str) -> str:
+    return url.translate(_quote_table) if url.isascii() else urllib.parse.quote(url)
+
+
+def xpi_download_urls(github_xpi_url: str) -> dict:
+    return {
+        'github': github_xpi_url,
+        'ghProxy': 'https://ghproxy.com/?q=' + quote_url(github_xpi_url),
+        'kgithub': github_xpi_url.replace('github.com', 'kkgithub.com', 1),
+    }
+
+
+_manifest_details: dict[tuple, concurrent.futures.Future] = {}
+_manifest_details_lock = threading.Lock()
+
+
+def xpi_manifest_details(xpi_filepath: str):
+    """manifests of a downloaded xpi, parsed once per file content even when several releases share the xpi"""
+    st = os.stat(xpi_filepath)
+    key = (xpi_filepath, st.st_mtime_ns, st.st_size)
+    with _manifest_details_lock:
+        future = _manifest_details.get(key)
+        is_parser = future is None
+        if is_parser:
+            future = _manifest_details[key] = concurrent.futures.Future()
+    if is_parser:
+        try:
+            future.set_result(addon_manifest_details(xpi_filepath))
+        except Exception as e:
+            future.set_exception(e)
+    return future.result()
 
 
 def parse_xpi_detail(plugin: AddonInfo, release: AddonInfoRelease, release_asset, **kwargs):
@@ -164,48 +415,54 @@ def parse_xpi_detail(plugin: AddonInfo, release: AddonInfoRelease, release_asset
     if release.targetZoteroVersion == '6':
         priority_sources = ['json', 'rdf']
 
+    def parse_details(xpi_filepath):
+        if not (manifest_details := xpi_manifest_details(xpi_filepath)):
+            # unreadable entries are swallowed while parsing, let the caller check the archive itself
+            raise ValueError('no readable manifest')
+        return xpi_detail_from_manifests(manifest_details, priority_sources)
+
     def xpi_detail(xpi_url, xpi_filename):
+        xpi_filepath = None
         try:
             xpi_filepath = download_xpi(xpi_url=xpi_url,
                                         download_dir=kwargs.get('runtime_xpi_directory'),
                                         unique_name=xpi_filename,
                                         force_download=False,
                                         cache_dir=kwargs.get('cache_directory'))
-            details = addon_details(xpi_filepath, priority_sources=priority_sources)
-            return details
-        except:
+            return parse_details(xpi_filepath)
+        except Exception as e:
+            # an intact archive would parse the same after downloading it again
+            if xpi_filepath and validate_xpi(xpi_filepath):
+                print(f'fetch addon detail of {plugin.repo} with {xpi_url} failed: {e}')
+                return
             try:
                 xpi_filepath = download_xpi(xpi_url=xpi_url,
                                             download_dir=kwargs.get('runtime_xpi_directory'),
                                             unique_name=xpi_filename,
                                             force_download=True)
-                details = addon_details(xpi_filepath, priority_sources=priority_sources)
-                return details
+                return parse_details(xpi_filepath)
             except Exception as e:
                 print(f'fetch addon detail of {plugin.repo} with {xpi_url} failed: {e}')
 
     github_xpi_url = release_asset['browser_download_url']
     release.releaseDate = release_asset['updated_at']
-    release.xpiDownloadUrl = {
-        'github': github_xpi_url,
-        'ghProxy': 'https://ghproxy.com/?q=' + urllib.parse.quote(github_xpi_url),
-        'kgithub': github_xpi_url.replace('github.com', 'kkgithub.com'),
-    }
+    release.xpiDownloadUrl = xpi_download_urls(github_xpi_url)
     details = xpi_detail(xpi_url=github_xpi_url,
-                         xpi_filename=f'{plugin.owner}#{plugin.repository}+{release.tagName}@{release_asset["id"]}.xpi')
+                         xpi_filename=release_xpi_filename(plugin, release, release_asset))
 
     if details and details.update_url and details.id and details.version:
         try:
-            update_json_resp = requests.get(details.update_url,
-                                            headers=github_api_headers(github_token=kwargs.get('github_token')))
-            update_json_info = json.loads(update_json_resp.content)
+            # update manifests can live on any host, never send the github token along
+            update_json_resp = SESSION.get(details.update_url)
+            update_json_resp.raise_for_status()
+            update_json_info = json_utils.loads(update_json_resp.content)
 
             updates = update_json_info.get('addons', {}).get(details.id, {}).get('updates', [])
             xpi_urls = [e.get('update_link') for e in updates if compare_versions(e.get('version'), details.version) > 0]
 
             for xpi_url in xpi_urls:
                 update_details = xpi_detail(xpi_url=xpi_url,
-                                            xpi_filename=f'{plugin.owner}#{plugin.repository}+update{details.version}.xpi')
+                                            xpi_filename=f'{plugin.slug}+update{details.version}.xpi')
                 if update_details and update_details.id and update_details.check_compatible_for_zotero_version(release.zotero_check_version):
                     details = update_details
                     release.xpiDownloadUrl = {
@@ -216,54 +473,191 @@ def parse_xpi_detail(plugin: AddonInfo, release: AddonInfoRelease, release_asset
     return details
 
 
-def fallback(addon_infos, previous_info_url, **kwargs):
+def fetch_previous_info(previous_info_url):
+    try:
+        # published files are served from raw and release download hosts, the github token is not sent there
+        # and the whole catalog is too large to keep in the etag cache
+        previous_info_resp = SESSION.get(previous_info_url)
+        previous_info_resp.raise_for_status()
+        return json_utils.loads(previous_info_resp.content)
+    except Exception as e:
+        print(f'request previous addon_info.json {previous_info_url} failed: {e}')
+
+
+def fallback(addon_infos, previous_info):
     try:
-        repos_resp = requests.get(previous_info_url,
-                                  headers=github_api_headers(github_token=kwargs.get('github_token')))
-        repos_info = json.loads(repos_resp.content)
-        addon_infos = fallback_if_need(addon_infos, repos_info)
+        addon_infos = fallback_if_need(addon_infos, previous_info)
     except Exception as e:
-        print(f'request previous addon_info.json to merge failed: {e}')
+        print(f'merge previous addon_info.json failed: {e}')
     return addon_infos
 
 
-def parse_addon_infos(input_dir, output_filepath, **kwargs):
-    plugins = []
-    for addon_json_filename in os.listdir(input_dir):
-        if not addon_json_filename.endswith('.json'):
+def previous_release_map(previous_infos):
+    """maps (repo, targetZoteroVersion, github xpi url, asset updated_at) to a release parsed in a previous run"""
+    result = {}
+    for previous_info in previous_infos:
+        if not isinstance(previous_info, list):
             continue
-        addon_json_filepath = os.path.join(input_dir, addon_json_filename)
-        with open(addon_json_filepath, 'r') as file:
+        for addon in previous_info:
+            for release in addon.get('releases') or []:
+                # only reuse releases whose xpi was parsed successfully
+                if not (release.get('id') and release.get('minZoteroVersion') and release.get('maxZoteroVersion')):
+                    continue
+                if not (github_xpi_url := (release.get('xpiDownloadUrl') or {}).get('github')):
+                    continue
+                key = (addon.get('repo'), release.get('targetZoteroVersion'), github_xpi_url, release.get('releaseDate'))
+                result.setdefault(key, release)
+    return result
+
+
+def load_addon_info(addon_json_filepath):
+    with open(addon_json_filepath, 'rb') as file:
+        try:
+            return AddonInfo(**json_utils.loads(file.read()))
+        except Exception as e:
+            print(f'parse initial addon info from {addon_json_filepath} failed: {e}')
+
+
+def load_addon_infos(addon_json_filepaths):
+    for addon_json_filepath in addon_json_filepaths:
+        if plugin := load_addon_info(addon_json_filepath):
+            yield plugin
+
+
+# the schedule refreshes everything every few hours, older partial results are not worth resuming
+PARTIAL_RESULT_MAX_AGE = 3 * 60 * 60
+
+
+def release_inputs(plugin: AddonInfo):
+    """releases as configured in the input addon json, a resumed result only stands for the same input"""
+    return [[release.targetZoteroVersion, release.tagName] for release in plugin.releases]
+
+
+def load_partial_results(partial_filepath):
+    """addon infos written by an interrupted run, keyed by repo with the release inputs they were parsed from"""
+    results = {}
+    try:
+        with open(partial_filepath, 'rb') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json_utils.loads(line)
+                    if time.time() - entry['savedAt'] > PARTIAL_RESULT_MAX_AGE:
+                        continue
+                    info = entry['info']
+                    info.pop('star', None)
+                    info.setdefault('releases', [])
+                    addon_info = AddonInfo(**info)
+                    addon_info.stars = addon_info.stars or 0
+                    results[addon_info.repo] = entry['input'], addon_info
+                except Exception as e:  # the last line may be cut off by the interruption
+                    print(f'skip partial result: {e}')
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def keep_resumed_addon(plugin: AddonInfo, cached_xpi_names, **kwargs):
+    """resumed addons are not parsed again, keep their etag entries and cached xpis for the next run"""
+    repo_url = f'https://api.github.com/repos/{plugin.repo}'
+    keep_etag_entries({f'https://api.github.com/users/{plugin.owner}', repo_url}, url_prefix=repo_url + '/releases')
+    if not (cache_directory := kwargs.get('cache_directory')) or not (
+            runtime_xpi_directory := kwargs.get('runtime_xpi_directory')):
+        return
+    for name in cached_xpi_names:
+        if name.startswith(plugin.slug + '+'):
             try:
-                plugins.append(AddonInfo(**json.load(file)))
+                link_cached_xpi(name, runtime_xpi_directory, cache_directory)
             except Exception as e:
-                print(f'parse initial addon info from {addon_json_filepath} failed: {e}')
+                print(f'keep cached xpi {name} of {plugin.repo} failed: {e}')
 
-    addon_infos = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(parse,
-                                   plugin,
-                                   github_token=kwargs.get('github_token'),
-                                   cache_directory=kwargs.get('cache_directory'),
-                                   runtime_xpi_directory=kwargs.get('runtime_xpi_directory'),
-                                   github_repository=kwargs.get('github_repository'))
-                   for plugin in plugins]
-
-        for future in concurrent.futures.as_completed(futures):
-            if addon_info := future.result():
-                addon_infos.append(addon_info)
 
-    addon_infos = [info.__dict__ for info in addon_infos]
-    for previous_info_url in kwargs.get('previous_info_urls', []):
-        addon_infos = fallback(addon_infos, previous_info_url, github_token=kwargs.get('github_token'))
+def parse_addon_infos(input_dir, output_filepath, **kwargs):
+    addon_json_filepaths = [entry.path for entry in os.scandir(input_dir) if entry.name.endswith('.json')]
+
+    previous_infos = [previous_info for previous_info_url in kwargs.get('previous_info_urls') or []
+                      if (previous_info := fetch_previous_info(previous_info_url))]
+    previous_releases = previous_release_map(previous_infos)
 
-    addon_infos.sort(key=lambda item: item.get('stars') if item.get('stars') else 0, reverse=True)
+    if dir := os.path.dirname(output_filepath):
+        os.makedirs(dir, exist_ok=True)
+    # every finished addon is appended here, a rerun after a crash resumes from it
+    partial_filepath = output_filepath + '.partial.jsonl'
+    finished = load_partial_results(partial_filepath)
+    cached_xpi_names = []
+    if finished and (cache_directory := kwargs.get('cache_directory')) and os.path.isdir(cache_directory):
+        cached_xpi_names = os.listdir(cache_directory)
 
-    dir = os.path.dirname(output_filepath)
-    if dir and not os.path.exists(dir):
-        os.makedirs(dir)
-    with open(output_filepath, "w") as json_file:
-        json.dump(addon_infos, json_file, ensure_ascii=False)
+    addon_infos = []
+    max_workers = max(1, min(kwargs.get('max_workers') or 16, len(addon_json_filepaths)))
+    download_workers = 2 * max_workers
+    # every worker may have its author and repo lookups in flight next to its release lookup,
+    # xpi downloads hold connections of their own
+    resize_session_pool(3 * max_workers + download_workers)
+    with (concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor,
+          concurrent.futures.ThreadPoolExecutor(max_workers=2 * max_workers) as info_executor,
+          concurrent.futures.ThreadPoolExecutor(max_workers=download_workers) as download_executor,
+          open(partial_filepath, 'ab') as partial_file):
+        if partial_file.tell():
+            partial_file.write(b'\n')  # never continue a line cut off by the interruption
+
+        def collect(future):
+            inputs = pending_inputs.pop(future)
+            if addon_info := future.result():
+                addon_infos.append(addon_info)
+                partial_file.write(json_utils.dumps({'savedAt': int(time.time()),
+                                                     'input': inputs,
+                                                     'info': addon_info.to_dict()}) + b'\n')
+                partial_file.flush()
+
+        # plugins are read lazily, keep only a bounded window of them queued
+        pending = set()
+        pending_inputs = {}
+        resumed_count = 0
+        for plugin in load_addon_infos(addon_json_filepaths):
+            inputs = release_inputs(plugin)
+            if (resumed := finished.get(plugin.repo)) and resumed[0] == inputs:
+                addon_infos.append(resumed[1])
+                keep_resumed_addon(plugin, cached_xpi_names, **kwargs)
+                resumed_count += 1
+                continue
+            if len(pending) >= 2 * max_workers:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+            future = executor.submit(parse,
+                                     plugin,
+                                     info_executor=info_executor,
+                                     download_executor=download_executor,
+                                     previous_releases=previous_releases,
+                                     use_graphql=kwargs.get('use_graphql'),
+                                     github_token=kwargs.get('github_token'),
+                                     cache_directory=kwargs.get('cache_directory'),
+                                     runtime_xpi_directory=kwargs.get('runtime_xpi_directory'),
+                                     github_repository=kwargs.get('github_repository'))
+            pending.add(future)
+            pending_inputs[future] = inputs
+
+        if resumed_count:
+            print(f'resume {resumed_count} addons parsed by an interrupted run')
+        for future in concurrent.futures.as_completed(pending):
+            collect(future)
+
+    if kwargs.get('previous_info_urls'):
+        # fallback merges plain dicts
+        addon_infos = [info.to_dict() for info in addon_infos]
+        for previous_info in previous_infos:
+            addon_infos = fallback(addon_infos, previous_info)
+        addon_infos.sort(key=operator.methodcaller('get', 'stars', 0), reverse=True)
+    else:
+        addon_infos.sort(key=operator.attrgetter('stars'), reverse=True)
+
+    json_utils.dump(addon_infos, output_filepath, default=AddonEncoder().default)
+    try:
+        os.remove(partial_filepath)
+    except Exception as e:
+        print(f'remove partial results {partial_filepath} failed: {e}')
 
     return addon_infos
 
@@ -277,9 +671,12 @@ if __name__ == '__main__':
 
     parser.add_argument('--cache_directory', nargs='?', default="caches", type=str, help='folder for caches')
     parser.add_argument('--cache_lockfile', nargs='?', default="caches_lockfile", type=str, help='hashfile for caches')
+    parser.add_argument('--etag_cache_file', nargs='?', default="etag_cache.json", type=str, help='etag cache filepath, kept out of the xpi cache directory')
     parser.add_argument('--runtime_xpi_directory', nargs='?', default="xpis", type=str, help='folder for download xpi')
     parser.add_argument('--previous_info_urls', nargs='+', default=[], help='previous published info json to fallback')
     parser.add_argument('--create_release', nargs='?', default=True, type=bool, help='create release in github')
+    parser.add_argument('--graphql', action='store_true', help='query addon repos with one graphql request, needs github token')
+    parser.add_argument('--max_workers', nargs='?', default=16, type=int, help='max concurrent addon parsing workers')
 
     args = parser.parse_args()
 
@@ -290,20 +687,22 @@ if __name__ == '__main__':
         rate_limit(args.github_token)
 
     try:
-        if not os.path.isdir(args.cache_directory):
-            os.makedirs(args.cache_directory, exist_ok=True)
-        if not os.path.isdir(args.runtime_xpi_directory):
-            os.makedirs(args.runtime_xpi_directory, exist_ok=True)
+        os.makedirs(args.cache_directory, exist_ok=True)
+        os.makedirs(args.runtime_xpi_directory, exist_ok=True)
     except Exception as e:
         print(f'create cache_directory failed: {e}')
 
+    load_etag_cache(args.etag_cache_file)
+
     parse_addon_infos(args.input,
                       args.output,
                       github_repository=args.github_repository,
                       github_token=args.github_token,
                       cache_directory=args.cache_directory,
                       runtime_xpi_directory=args.runtime_xpi_directory,
-                      previous_info_urls=args.previous_info_urls)
+                      previous_info_urls=args.previous_info_urls,
+                      max_workers=args.max_workers,
+                      use_graphql=args.graphql)
 
     delete_release(args.github_repository, github_token=args.github_token)
     delete_tag(args.github_repository, github_token=args.github_token)
@@ -315,6 +714,8 @@ if __name__ == '__main__':
                                github_token=args.github_token)
 
     update_cache(args.cache_directory, args.runtime_xpi_directory, args.cache_lockfile)
+    # the cache directory is only kept when its xpi set changes, the etag cache changes independently of it
+    save_etag_cache(args.etag_cache_file)
 
     if args.github_token:
         delete_cache(args.github_repository, args.github_token, remain_count=1)
@@ -1,30 +1,51 @@
 # modify from `https://github.com/
 # mozilla/gecko-dev/blob/ac19e2c0d7c09a2deaedbe6afc4cdcf1a4561456/testing/mozbase/mozprofile/mozprofile/addons.py#L213`
 
+import functools
+import io
 import zipfile
 import commentjson as json
+import json_utils
 import os
-from xml.dom import minidom
+try:
+    from lxml import etree
+except ImportError:
+    try:
+        # same api as xml.etree, but refuses entity expansion and external references
+        import defusedxml.ElementTree as etree
+    except ImportError:
+        import xml.etree.ElementTree as etree
 import re
 
 
-def compare_versions(version1, version2):
-    parts1 = version1.replace('-', '.').split('.')
-    parts2 = version2.replace('-', '.').split('.')
+_msg_placeholder_pattern = re.compile(r'__MSG_(.*?)__')
 
-    for i in range(max(len(parts1), len(parts2))):
-        v1 = parts1[i] if i < len(parts1) else '0'
-        v2 = parts2[i] if i < len(parts2) else '0'
-        try:
-            num1 = int(v1)
-        except ValueError:
-            num1 = v1
+
+@functools.lru_cache(maxsize=1024)
+def version_parts(version):
+    """dotted parts of a version paired with their int value, None for non numeric parts"""
+    parts = []
+    for part in version.replace('-', '.').split('.'):
         try:
-            num2 = int(v2)
+            parts.append((int(part), part))
         except ValueError:
-            num2 = v2
+            parts.append((None, part))
+    return tuple(parts)
+
+
+_missing_version_part = (0, '0')
+
+
+@functools.lru_cache(maxsize=1024)
+def compare_versions(version1, version2):
+    parts1 = version_parts(version1)
+    parts2 = version_parts(version2)
 
-        if isinstance(num1, int) and isinstance(num2, int):
+    for i in range(max(len(parts1), len(parts2))):
+        num1, v1 = parts1[i] if i < len(parts1) else _missing_version_part
+        num2, v2 = parts2[i] if i < len(parts2) else _missing_version_part
+
+        if num1 is not None and num2 is not None:
             if num1 < num2:
                 return -1
             if num1 > num2:
@@ -78,57 +99,71 @@ class XpiDetail:
                     <= compare_versions(max_version, version.replace('*', '0')))
 
 
-def get_namespace_id(doc, url):
-    attributes = doc.documentElement.attributes
-    for i in range(attributes.length):
-        if attributes.item(i).value == url and ":" in attributes.item(i).name:
-            return attributes.item(i).name.split(":")[1] + ":"
-    return ""
+_em_namespace = '{http://www.mozilla.org/2004/em-rdf#}'
+_rdf_namespace = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+
+
+def rdf_entry(name):
+    """name of an em:* tag or attribute without its namespace, other namespaced names never match a detail key"""
+    if name.startswith(_em_namespace):
+        return name[len(_em_namespace):]
+    if name.startswith('{'):
+        return None
+    return name
+
+
+def is_rdf_description(element):
+    return element.tag in (_rdf_namespace + 'Description', 'Description')
 
 
 def get_text(element):
     """Retrieve the text value of a given node"""
-    rc = []
-    for node in element.childNodes:
-        if node.nodeType == node.TEXT_NODE:
-            rc.append(node.data)
-    return "".join(rc).strip()
+    return ((element.text or '') + ''.join(child.tail or '' for child in element)).strip()
+
+
+def parse_rdf(manifest):
+    if etree.__name__ == 'lxml.etree':
+        return etree.fromstring(manifest, etree.XMLParser(resolve_entities=False, no_network=True))
+    return etree.fromstring(manifest)
+
+
+def read_addon_file(addon, filename):
+    """content of `filename` in an opened xpi or an unpacked addon directory, None when it is missing"""
+    if isinstance(addon, zipfile.ZipFile):
+        try:
+            return addon.read(filename)
+        except KeyError:
+            return None
+    filepath = os.path.join(addon, filename)
+    if os.path.isfile(filepath):
+        with open(filepath, 'rb') as f:
+            return f.read()
 
 
-def manifest_from_json(addon_path):
+def loads_manifest(content: bytes):
+    """manifests are plain json nearly always, the comment tolerant parser only runs when that fails"""
     try:
-        if zipfile.is_zipfile(addon_path):
-            with zipfile.ZipFile(addon_path, "r") as compressed_file:
-                filenames = [f.filename for f in compressed_file.filelist]
-                if "manifest.json" in filenames:
-                    manifest = compressed_file.read("manifest.json").decode()
-                    manifest = json.loads(manifest)
-                    return manifest
-        elif os.path.isdir(addon_path):
-            with open(os.path.join(addon_path, "manifest.json")) as f:
-                manifest = json.loads(f.read())
-                return manifest
+        return json_utils.loads(content)
+    except ValueError:
+        return json.loads(content.decode('utf-8-sig'))
+
+
+def manifest_from_json(addon):
+    try:
+        if manifest := read_addon_file(addon, "manifest.json"):
+            return loads_manifest(manifest)
     except Exception as e:
-        print(f'Invalid Addon Path {addon_path}: {e}')
+        print(f'Invalid Addon Path {getattr(addon, "filename", addon)}: {e}')
 
 
-def manifest_from_rdf(addon_path):
+def manifest_from_rdf(addon):
     try:
-        if zipfile.is_zipfile(addon_path):
-            with zipfile.ZipFile(addon_path, "r") as compressed_file:
-                filenames = [f.filename for f in compressed_file.filelist]
-                if "install.rdf" in filenames:
-                    manifest = compressed_file.read("install.rdf")
-                    return manifest
-        elif os.path.isdir(addon_path):
-            with open(os.path.join(addon_path, "install.rdf")) as f:
-                manifest = json.loads(f.read())
-                return manifest
+        return read_addon_file(addon, "install.rdf")
     except Exception as e:
-        print(f'Invalid Addon Path {addon_path}: {e}')
+        print(f'Invalid Addon Path {getattr(addon, "filename", addon)}: {e}')
 
 
-def detail_from_manifest_json(addon_path, manifest):
+def detail_from_manifest_json(addon, manifest):
     details = {
         "name": manifest.get("name"),
         "version": manifest.get("version"),
@@ -153,24 +188,14 @@ def detail_from_manifest_json(addon_path, manifest):
 
     # handler for __MSG_{}__ items
     def extract_msg_placeholder(text):
-        if match := re.search(r'__MSG_(.*?)__', text):
+        if match := _msg_placeholder_pattern.search(text):
             return match.group(1)
 
     def load_locale_for_msg():
         default_locale = manifest.get('default_locale')
         locale_filename = f"_locales/{default_locale}/messages.json"
-        try:
-            if zipfile.is_zipfile(addon_path):
-                with zipfile.ZipFile(addon_path, "r") as compressed_file:
-                    filenames = [f.filename for f in compressed_file.filelist]
-                    if locale_filename in filenames:
-                        locale = compressed_file.read(locale_filename).decode()
-                        return json.loads(locale)
-            elif os.path.isdir(addon_path):
-                with open(os.path.join(addon_path, locale_filename)) as f:
-                    return json.loads(f.read())
-        except Exception as e:
-            raise e
+        if locale := read_addon_file(addon, locale_filename):
+            return loads_manifest(locale)
 
     locale_for_msg = None
     for key in details:
@@ -196,33 +221,22 @@ def detail_from_manifest_rdf(manifest):
         "updateURL": None,
     }
     try:
-        doc = minidom.parseString(manifest)
-
-        # Get the namespaces abbreviations
-        em = get_namespace_id(doc, "http://www.mozilla.org/2004/em-rdf#")
-        rdf = get_namespace_id(doc, "http://www.w3.org/1999/02/22-rdf-syntax-ns#")
+        root = parse_rdf(manifest)
 
-        description = doc.getElementsByTagName(rdf + "Description").item(0)
-        try:
-            descriptions = [e for e in doc.getElementsByTagName(rdf + "Description")
-                            if len(e.getElementsByTagName(em + "targetApplication")) > 0]
-            if descriptions:
-                description = descriptions[0]
-        except Exception as e:
-            pass
+        descriptions = [e for e in root.iter() if is_rdf_description(e)]
+        if not descriptions:
+            return
+        # prefer the description declaring target applications
+        description = next((e for e in descriptions
+                            if next(e.iter(_em_namespace + "targetApplication"), None) is not None), descriptions[0])
 
         def extract_info(node, result):
-            try:
-                for entry, value in node.attributes.items():
-                    entry = entry.replace(em, "")
-                    if entry in result.keys():
-                        result.update({entry: value})
-                for child_node in node.childNodes:
-                    entry = child_node.nodeName.replace(em, "")
-                    if entry in result.keys():
-                        result.update({entry: get_text(child_node)})
-            except:
-                return
+            for name, value in node.attrib.items():
+                if (entry := rdf_entry(name)) in result:
+                    result[entry] = value
+            for child_node in node:
+                if isinstance(child_node.tag, str) and (entry := rdf_entry(child_node.tag)) in result:
+                    result[entry] = get_text(child_node)
 
         extract_info(description, details)
         if not details.get('id') or (details.get('id').startswith("__") and details.get('id').endswith("__")):
@@ -247,12 +261,14 @@ def detail_from_manifest_rdf(manifest):
                 else:
                     details['max_version'] = max_version
 
-        for targetApplication in description.getElementsByTagName(em + "targetApplication"):
+        for targetApplication in description.iter(_em_namespace + "targetApplication"):
             version_info = {'id': None, 'minVersion': None, 'maxVersion': None}
             extract_info(targetApplication, version_info)
             update_details(version_info)
 
-            for node in targetApplication.childNodes:
+            for node in targetApplication:
+                if not isinstance(node.tag, str):
+                    continue
                 version_info = {'id': None, 'minVersion': None, 'maxVersion': None}
                 extract_info(node, version_info)
                 update_details(version_info)
@@ -265,19 +281,59 @@ def detail_from_manifest_rdf(manifest):
         raise e
 
 
+def validate_xpi(addon_path):
+    """whether the xpi is a readable zip archive with intact entries"""
+    try:
+        with zipfile.ZipFile(addon_path, "r") as compressed_file:
+            return compressed_file.testzip() is None
+    except Exception:
+        return False
+
+
+IN_MEMORY_XPI_BYTES = 16 * 1024 * 1024
+
+
 def addon_details(addon_path, priority_sources=None) -> XpiDetail:
-    if priority_sources is None:
-        priority_sources = ['json', 'rdf']
+    return xpi_detail_from_manifests(addon_manifest_details(addon_path), priority_sources)
+
+
+def addon_manifest_details(addon_path) -> dict:
+    """details of every manifest in the addon keyed by source, independent of their priority"""
     if not os.path.exists(addon_path):
         raise IOError(f"Add-on path does not exist: {addon_path}")
+    # the xpi is opened once, its central directory is shared by every lookup below
+    try:
+        if os.path.getsize(addon_path) <= IN_MEMORY_XPI_BYTES:
+            # small xpis are read in one pass instead of seeking around the file per entry
+            with open(addon_path, 'rb') as f:
+                addon_file = io.BytesIO(f.read())
+        else:
+            addon_file = addon_path
+        with zipfile.ZipFile(addon_file, "r") as compressed_file:
+            return manifest_details_from_addon(compressed_file)
+    except (zipfile.BadZipFile, IsADirectoryError):
+        # only unpacked addons are read as directories, a broken xpi has to be reported to the caller
+        if not os.path.isdir(addon_path):
+            raise
+        return manifest_details_from_addon(addon_path)
+
+
+def manifest_details_from_addon(addon) -> dict:
+    manifest_details = {}
+    if ((manifest := manifest_from_json(addon)) and
+            (details := detail_from_manifest_json(addon, manifest))):
+        manifest_details['json'] = details
+    if ((manifest := manifest_from_rdf(addon)) and
+            (details := detail_from_manifest_rdf(manifest))):
+        manifest_details['rdf'] = details
+    return manifest_details
+
+
+def xpi_detail_from_manifests(manifest_details: dict, priority_sources=None) -> XpiDetail:
+    if priority_sources is None:
+        priority_sources = ['json', 'rdf']
     xpi_detail = XpiDetail()
     for source in priority_sources:
-        if source == 'json':
-            if ((manifest := manifest_from_json(addon_path)) and
-                    (details := detail_from_manifest_json(addon_path, manifest))):
-                xpi_detail._append_info(details)
-        if source == 'rdf':
-            if ((manifest := manifest_from_rdf(addon_path)) and
-                    (details := detail_from_manifest_rdf(manifest))):
-                xpi_detail._append_info(details)
+        if details := manifest_details.get(source):
+            xpi_detail._append_info(details)
     return xpi_detail